@@ -1,6 +1,18 @@
 from pathlib import Path
+from datetime import datetime
+import atexit
+import hashlib
+import io
+import json
+import logging
+import queue
+import sqlite3
+import threading
+from collections import OrderedDict
 import streamlit as st
 import pandas as pd
+import numpy as np
+import plotly.graph_objects as go
 import re
 
 # --------------------------------------------------------------------
@@ -88,9 +100,353 @@ st.markdown("---")
 st.subheader("Indicadores a utilizar")
 opcion = st.radio(
     "Selecciona qué quieres calcular:",
-    ("Porcentaje de diversidad", "Puntos de accesibilidad y conexión"),
+    (
+        "Porcentaje de diversidad",
+        "Puntos de accesibilidad y conexión",
+        "Tablero de resultados por lote",
+    ),
 )
 
+# --------------------------------------------------------------------
+# Bitácora persistente de consultas (SQLite)
+# --------------------------------------------------------------------
+DIARIO_PATH = BASE_DIR / "data" / "consultas.sqlite3"
+
+# Se mezcla en el hash del texto: súbela cada vez que cambie `extraer_valores`
+# o `parsear_tabla_accesibilidad`, para no reutilizar conteos del parser anterior.
+VERSION_PARSEO = 1
+
+logger = logging.getLogger(__name__)
+
+AYUDA_ETIQUETA_AREA = (
+    "La etiqueta y el resultado se guardan en un historial compartido: "
+    "cualquier persona que use esta app puede verlos en «Consultas anteriores»."
+)
+
+
+def huella_texto(texto: str) -> str:
+    """
+    Devuelve el hash SHA-256 del texto pegado (ya recortado) junto con la
+    versión del parser, usado para reconocer pegados repetidos aun después de
+    reiniciar el servidor.
+    """
+    return hashlib.sha256(f"{VERSION_PARSEO}\n{texto}".encode("utf-8")).hexdigest()
+
+
+class DiarioConsultas:
+    """
+    Guarda cada resultado calculado en una base SQLite local en modo WAL.
+
+    Las escrituras se encolan y un hilo en segundo plano las inserta por lotes,
+    así el hilo de la interfaz nunca espera al disco. Los registros encolados
+    que aún no se escriben se consultan desde memoria, de modo que un pegado
+    repetido se reconoce de inmediato.
+
+    La base es única para todo el servidor: el historial es compartido por
+    todas las personas que usan la aplicación.
+    """
+
+    def __init__(self, ruta: Path, tam_lote: int = 50, tam_cache: int = 512):
+        self._ruta = ruta
+        self._tam_lote = tam_lote
+        self._tam_cache = tam_cache
+        self._cola = queue.Queue()
+        self._pendientes = []  # registros encolados que aún no se escriben
+        self._cache = OrderedDict()  # (hash, seccion) -> último registro conocido
+        self._lock = threading.Lock()
+
+        ruta.parent.mkdir(parents=True, exist_ok=True)
+        con = self._conectar()
+        try:
+            con.execute("PRAGMA journal_mode=WAL")
+            con.execute(
+                """
+                CREATE TABLE IF NOT EXISTS consultas (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    hash TEXT NOT NULL,
+                    seccion TEXT NOT NULL,
+                    area TEXT,
+                    conteos TEXT NOT NULL,
+                    mnnapam REAL,
+                    pa REAL,
+                    pc REAL,
+                    creado TEXT NOT NULL
+                )
+                """
+            )
+            con.execute("CREATE INDEX IF NOT EXISTS idx_consultas_hash ON consultas (hash)")
+            con.execute("CREATE INDEX IF NOT EXISTS idx_consultas_area ON consultas (area)")
+            con.commit()
+        finally:
+            con.close()
+
+        self._hilo = threading.Thread(
+            target=self._escritor, name="diario-consultas", daemon=True
+        )
+        self._hilo.start()
+        atexit.register(self.cerrar)
+
+    def _conectar(self) -> sqlite3.Connection:
+        con = sqlite3.connect(self._ruta, timeout=10)
+        con.row_factory = sqlite3.Row
+        return con
+
+    def _escritor(self) -> None:
+        con = None
+        activo = True
+        while activo:
+            # Espera el primer registro y luego junta lo que ya esté en la cola
+            lote = [self._cola.get()]
+            while len(lote) < self._tam_lote:
+                try:
+                    lote.append(self._cola.get_nowait())
+                except queue.Empty:
+                    break
+
+            if None in lote:
+                activo = False
+                lote = [r for r in lote if r is not None]
+            if not lote:
+                continue
+
+            try:
+                if con is None:
+                    con = self._conectar()
+                    con.execute("PRAGMA synchronous=NORMAL")
+                con.executemany(
+                    """
+                    INSERT INTO consultas (hash, seccion, area, conteos, mnnapam, pa, pc, creado)
+                    VALUES (:hash, :seccion, :area, :conteos, :mnnapam, :pa, :pc, :creado)
+                    """,
+                    [{**r, "conteos": json.dumps(r["conteos"], ensure_ascii=False)} for r in lote],
+                )
+                con.commit()
+            except Exception:
+                # Un lote fallido (base bloqueada, disco lleno...) se descarta,
+                # pero el hilo sigue vivo para los siguientes.
+                logger.exception(
+                    "No se pudieron guardar %d consultas en %s", len(lote), self._ruta
+                )
+                if con is not None:
+                    try:
+                        con.rollback()
+                    except sqlite3.Error:
+                        con.close()
+                        con = None
+            finally:
+                escritos = {id(r) for r in lote}
+                with self._lock:
+                    self._pendientes = [
+                        r for r in self._pendientes if id(r) not in escritos
+                    ]
+        if con is not None:
+            con.close()
+
+    def registrar(
+        self,
+        huella: str,
+        seccion: str,
+        conteos: dict,
+        area: str = None,
+        mnnapam: float = None,
+        pa: float = None,
+        pc: float = None,
+    ) -> None:
+        """
+        Encola un resultado para escribirlo en segundo plano (no bloquea).
+        """
+        registro = {
+            "hash": huella,
+            "seccion": seccion,
+            "area": area or None,
+            "conteos": conteos,
+            "mnnapam": mnnapam,
+            "pa": pa,
+            "pc": pc,
+            "creado": datetime.now().isoformat(timespec="seconds"),
+        }
+        with self._lock:
+            self._pendientes.append(registro)
+            self._recordar(registro)
+        self._cola.put(registro)
+
+    def _recordar(self, registro: dict) -> None:
+        # Llamar con self._lock tomado
+        clave = (registro["hash"], registro["seccion"])
+        self._cache[clave] = registro
+        self._cache.move_to_end(clave)
+        while len(self._cache) > self._tam_cache:
+            self._cache.popitem(last=False)
+
+    def buscar(self, huella: str, seccion: str):
+        """
+        Devuelve el registro más reciente con ese hash y sección, o None.
+        Los aciertos se guardan en memoria, así un pegado repetido no toca el
+        disco. Puede lanzar sqlite3.Error si la base no se puede leer.
+        """
+        with self._lock:
+            registro = self._cache.get((huella, seccion))
+            if registro is not None:
+                self._cache.move_to_end((huella, seccion))
+                return registro
+            for registro in reversed(self._pendientes):
+                if registro["hash"] == huella and registro["seccion"] == seccion:
+                    return registro
+
+        con = self._conectar()
+        try:
+            fila = con.execute(
+                "SELECT * FROM consultas WHERE hash = ? AND seccion = ? "
+                "ORDER BY id DESC LIMIT 1",
+                (huella, seccion),
+            ).fetchone()
+        finally:
+            con.close()
+        if fila is None:
+            return None
+        registro = dict(fila)
+        registro["conteos"] = json.loads(registro["conteos"])
+        with self._lock:
+            self._recordar(registro)
+        return registro
+
+    def recientes(self, seccion: str, area: str = None, limite: int = 20) -> pd.DataFrame:
+        """
+        Devuelve los últimos resultados de una sección (incluidos los que aún
+        no se escriben), opcionalmente filtrados por etiqueta de área exacta.
+        Puede lanzar sqlite3.Error si la base no se puede leer.
+        """
+        columnas = ["hash", "area", "mnnapam", "pa", "pc", "creado"]
+
+        # Los pendientes se copian antes de leer la base: un registro que se
+        # escriba entre ambos pasos aparece en los dos y se quita abajo.
+        with self._lock:
+            pendientes = [
+                {c: r[c] for c in columnas}
+                for r in reversed(self._pendientes)
+                if r["seccion"] == seccion and (not area or r["area"] == area)
+            ]
+
+        consulta = f"SELECT {', '.join(columnas)} FROM consultas WHERE seccion = ?"
+        parametros = [seccion]
+        if area:
+            consulta += " AND area = ?"
+            parametros.append(area)
+        consulta += " ORDER BY id DESC LIMIT ?"
+        parametros.append(limite)
+
+        con = self._conectar()
+        try:
+            guardados = pd.read_sql_query(consulta, con, params=parametros)
+        finally:
+            con.close()
+
+        if not pendientes:
+            return guardados.drop(columns="hash")
+
+        pendientes = pd.DataFrame(pendientes, columns=columnas).astype(
+            {"mnnapam": "float64", "pa": "float64", "pc": "float64"}
+        )
+        df = pd.concat([pendientes, guardados], ignore_index=True)
+        df = df.drop_duplicates(subset=["hash", "area", "creado"])
+        return df.head(limite).drop(columns="hash")
+
+    def ultimos_por_area(self) -> list:
+        """
+        Devuelve [(area, seccion, conteos), ...] con el registro más reciente de
+        cada área etiquetada en cada sección. Solo lee lo ya escrito en disco.
+        Puede lanzar sqlite3.Error si la base no se puede leer.
+        """
+        con = self._conectar()
+        try:
+            filas = con.execute(
+                "SELECT area, seccion, conteos FROM consultas WHERE id IN ("
+                "SELECT MAX(id) FROM consultas WHERE area IS NOT NULL "
+                "GROUP BY area, seccion)"
+            ).fetchall()
+        finally:
+            con.close()
+        return [(f["area"], f["seccion"], json.loads(f["conteos"])) for f in filas]
+
+    def cerrar(self) -> None:
+        """
+        Escribe lo pendiente y detiene el hilo escritor.
+        """
+        if self._hilo.is_alive():
+            self._cola.put(None)
+            self._hilo.join(timeout=5)
+
+
+@st.cache_resource
+def obtener_diario():
+    """
+    Devuelve la bitácora compartida, o None si no se puede abrir (sistema de
+    archivos de solo lectura, base dañada...). El None también se cachea, así
+    el fallo se registra una sola vez por proceso. Las calculadoras funcionan
+    igual sin la bitácora; solo no se guardan los resultados.
+    """
+    try:
+        return DiarioConsultas(DIARIO_PATH)
+    except (OSError, sqlite3.Error):
+        logger.exception("No se pudo abrir la bitácora de consultas en %s", DIARIO_PATH)
+        return None
+
+
+def buscar_en_diario(diario, huella: str, seccion: str):
+    """
+    Busca un resultado previo sin interrumpir el cálculo si la base falla.
+    """
+    if diario is None:
+        return None
+    try:
+        return diario.buscar(huella, seccion)
+    except (sqlite3.Error, ValueError):
+        logger.exception("No se pudo consultar la bitácora de consultas")
+        return None
+
+
+def mostrar_historial(seccion: str, columnas: dict) -> None:
+    """
+    Muestra, a petición, los resultados guardados de la sección.
+    `columnas` mapea las columnas de la base a los encabezados de la tabla.
+    """
+    diario = obtener_diario()
+    if diario is None:
+        st.warning(
+            "El historial de consultas no está disponible; "
+            "los resultados de esta sesión no se guardarán."
+        )
+        return
+
+    # La consulta solo se ejecuta cuando el usuario pide ver el historial
+    if not st.checkbox(
+        "Mostrar consultas anteriores (de todas las personas que usan esta app)",
+        key=f"historial_{seccion}",
+    ):
+        return
+
+    area = st.text_input(
+        "Filtrar por etiqueta del área (exacta):", key=f"filtro_area_{seccion}"
+    )
+    try:
+        df = diario.recientes(seccion, area=area.strip() or None)
+    except sqlite3.Error:
+        logger.exception("No se pudo leer la bitácora de consultas")
+        st.warning("No se pudo leer el historial de consultas.")
+        return
+
+    if df.empty:
+        st.info("Aún no hay consultas guardadas.")
+        return
+    df = df[["creado", "area"] + list(columnas)]
+    df = df.rename(columns={"creado": "Fecha", "area": "Área", **columnas})
+    df["Área"] = df["Área"].fillna("")
+    st.markdown(
+        f'<div class="stTable tabla-scroll">{df.to_html(index=False, float_format="{:.2f}".format)}</div>',
+        unsafe_allow_html=True,
+    )
+
+
 # --------------------------------------------------------------------
 # Definición de etiquetas y funciones comunes (Sección diversidad)
 # --------------------------------------------------------------------
@@ -126,6 +482,34 @@ def extraer_valores(texto: str):
     return valores
 
 
+def conteos_diversidad_completos(valores) -> bool:
+    """
+    Indica si un dict de conteos (por ejemplo, recuperado del historial)
+    trae los 8 valores enteros que produce `extraer_valores`.
+    """
+    return isinstance(valores, dict) and all(
+        isinstance(valores.get(codigo), int) for _, codigo in ETIQUETAS
+    )
+
+
+def calcular_mnnapam(valores: dict) -> float:
+    """
+    Calcula la proporción MNNAPAM (de 0 a 10) a partir de los conteos de población.
+    Lanza ValueError si la población total es 0.
+    """
+    PT = valores["PT"]
+    PF = valores["PF"]
+    PM = valores["PM"]
+    NNA = valores["NNA"]
+    PAM = valores["PAM"]
+
+    if PT == 0:
+        raise ValueError("La Población total (PT) no puede ser 0. Verifica los datos.")
+
+    # Fórmula: (PF + NNA*(PM/PT) + PAM*(PM/PT)) / PT
+    return ((PF + NNA * (PM / PT) + PAM * (PM / PT)) / PT)*10
+
+
 # --------------------------------------------------------------------
 # Sección 1: Porcentaje de diversidad (MNNAPAM)
 # --------------------------------------------------------------------
@@ -165,42 +549,55 @@ y se convertirán automáticamente a enteros sin comas.
         ),
     )
 
+    area = st.text_input(
+        "Etiqueta del área (opcional):",
+        key="area_diversidad",
+        help=AYUDA_ETIQUETA_AREA,
+    )
+
     if st.button("Calcular indicadores de diversidad"):
         texto_limpio = (texto or "").strip()
         if not texto_limpio:
             st.error("Por favor, copia y pega el bloque de texto con los datos de población.")
             return
 
-        valores = extraer_valores(texto_limpio)
-
-        # Validar que se encontraron las 8 variables
-        if len(valores) != len(ETIQUETAS):
-            faltantes = [cod for _, cod in ETIQUETAS if cod not in valores]
-            st.error(
-                "No se detectaron correctamente los 8 valores requeridos. "
-                "Por favor, copia y pega nuevamente el bloque completo desde "
-                "'Población total' hasta 'Población con discapacidad'."
-            )
-            if faltantes:
-                st.info("Variables faltantes o mal detectadas: " + ", ".join(faltantes))
-            return
+        diario = obtener_diario()
+        huella = huella_texto(texto_limpio)
+        previo = buscar_en_diario(diario, huella, "diversidad")
+
+        if previo is not None and conteos_diversidad_completos(previo["conteos"]):
+            # Pegado repetido: se reutilizan los conteos guardados sin volver a parsear
+            valores = previo["conteos"]
+            st.caption(f"Datos recuperados del historial ({previo['creado']}).")
+        else:
+            valores = extraer_valores(texto_limpio)
+
+            # Validar que se encontraron las 8 variables
+            if len(valores) != len(ETIQUETAS):
+                faltantes = [cod for _, cod in ETIQUETAS if cod not in valores]
+                st.error(
+                    "No se detectaron correctamente los 8 valores requeridos. "
+                    "Por favor, copia y pega nuevamente el bloque completo desde "
+                    "'Población total' hasta 'Población con discapacidad'."
+                )
+                if faltantes:
+                    st.info("Variables faltantes o mal detectadas: " + ", ".join(faltantes))
+                return
 
         PT = valores["PT"]
-        PF = valores["PF"]
-        PM = valores["PM"]
-        NNA = valores["NNA"]
-        PJ = valores["PJ"]
-        PA = valores["PA"]
-        PAM = valores["PAM"]
-        PD = valores["PD"]
-
-        if PT == 0:
-            st.error("La Población total (PT) no puede ser 0. Verifica los datos.")
-            return
 
         # Cálculo de la proporción MNNAPAM
-        # Fórmula: (PF + NNA*(PM/PT) + PAM*(PM/PT)) / PT
-        mnn_pam = ((PF + NNA * (PM / PT) + PAM * (PM / PT)) / PT)*10
+        try:
+            mnn_pam = calcular_mnnapam(valores)
+        except ValueError as e:
+            st.error(str(e))
+            return
+
+        # Se guarda también en pegados repetidos para registrar la etiqueta actual
+        if diario is not None:
+            diario.registrar(
+                huella, "diversidad", valores, area=area.strip(), mnnapam=mnn_pam
+            )
 
         st.markdown(
             f"""
@@ -371,6 +768,21 @@ def parsear_tabla_accesibilidad(texto: str):
     return valores
 
 
+CAMPOS_ACCESO = ("en_todas", "en_alguna", "en_ninguna", "no_especificado", "no_aplica")
+
+
+def conteos_acceso_completos(valores) -> bool:
+    """
+    Indica si un dict de conteos (por ejemplo, recuperado del historial)
+    trae los 21 indicadores con sus 5 enteros, como `parsear_tabla_accesibilidad`.
+    """
+    return isinstance(valores, dict) and all(
+        isinstance(valores.get(codigo), dict)
+        and all(isinstance(valores[codigo].get(campo), int) for campo in CAMPOS_ACCESO)
+        for _, codigo in INDICADORES_ACCESO
+    )
+
+
 def calcular_TM(valores_indicadores: dict) -> int:
     """
     Calcula TM a partir de RDC y TC y verifica que sean iguales.
@@ -467,6 +879,38 @@ def calcular_puntajes_acceso(valores_indicadores: dict):
     return puntajes, TM
 
 
+def calcular_puntajes_agregados(puntajes: dict):
+    """
+    Calcula el Puntaje Accesibilidad (PA) y el Puntaje Conexiones (PC) a partir
+    de los puntajes normalizados por indicador. Devuelve (PA, PC).
+    """
+    pa = (
+        puntajes["RDC"] * 0.5
+        + puntajes["RSR"] * 2.0
+        + puntajes["PP"] * 2.0
+        + puntajes["BQ"] * 1.0
+        + puntajes["GN"] * 0.5
+        + puntajes["SA"] * 1.0
+        + puntajes["PTP"] * 1.0
+        + puntajes["SRPP"] * 2.0
+    )
+
+    pc = (
+        puntajes["RDC"] * 1.0
+        + puntajes["BQ"] * 1.0
+        + puntajes["GN"] * 1.0
+        + puntajes["CV"] * 1.5
+        + puntajes["CC"] * 0.5
+        + puntajes["LNC"] * 1.0
+        + puntajes["SP"] * 1.0
+        + puntajes["PTP"] * 1.0
+        + puntajes["EBC"] * 1.0
+        + puntajes["TC"] * 1.0
+    )
+
+    return pa, pc
+
+
 # --------------------------------------------------------------------
 # Sección 2: Puntos de accesibilidad y conexión
 # --------------------------------------------------------------------
@@ -521,33 +965,48 @@ Se ignorará cualquier otra línea, como la cabecera o la fecha de actualizació
         ),
     )
 
+    area = st.text_input(
+        "Etiqueta del área (opcional):",
+        key="area_accesibilidad",
+        help=AYUDA_ETIQUETA_AREA,
+    )
+
     if st.button("Calcular puntos de accesibilidad y conexión"):
         texto_limpio = (texto_tabla or "").strip()
         if not texto_limpio:
             st.error("Por favor, copia y pega la tabla completa de accesibilidad y conexión.")
             return
 
-        # 1) Parsear tabla
-        valores_indicadores = parsear_tabla_accesibilidad(texto_limpio)
-
-        # 2) Validar que se encontraron los 21 indicadores
-        codigos_esperados = [cod for _, cod in INDICADORES_ACCESO]
-        codigos_encontrados = list(valores_indicadores.keys())
-
-        if len(valores_indicadores) != len(INDICADORES_ACCESO):
-            faltantes = [c for c in codigos_esperados if c not in codigos_encontrados]
-            st.error(
-                "No se detectaron correctamente todos los indicadores requeridos.\n\n"
-                "Por favor, copia y pega nuevamente la tabla completa desde "
-                "'Recubrimiento de la calle' hasta 'Puesto ambulante', "
-                "incluyendo los encabezados de columna."
-            )
-            if faltantes:
-                st.info(
-                    "Indicadores faltantes o mal detectados (por código): "
-                    + ", ".join(faltantes)
+        diario = obtener_diario()
+        huella = huella_texto(texto_limpio)
+        previo = buscar_en_diario(diario, huella, "accesibilidad")
+
+        if previo is not None and conteos_acceso_completos(previo["conteos"]):
+            # Pegado repetido: se reutilizan los conteos guardados sin volver a parsear
+            valores_indicadores = previo["conteos"]
+            st.caption(f"Datos recuperados del historial ({previo['creado']}).")
+        else:
+            # 1) Parsear tabla
+            valores_indicadores = parsear_tabla_accesibilidad(texto_limpio)
+
+            # 2) Validar que se encontraron los 21 indicadores
+            codigos_esperados = [cod for _, cod in INDICADORES_ACCESO]
+            codigos_encontrados = list(valores_indicadores.keys())
+
+            if len(valores_indicadores) != len(INDICADORES_ACCESO):
+                faltantes = [c for c in codigos_esperados if c not in codigos_encontrados]
+                st.error(
+                    "No se detectaron correctamente todos los indicadores requeridos.\n\n"
+                    "Por favor, copia y pega nuevamente la tabla completa desde "
+                    "'Recubrimiento de la calle' hasta 'Puesto ambulante', "
+                    "incluyendo los encabezados de columna."
                 )
-            return
+                if faltantes:
+                    st.info(
+                        "Indicadores faltantes o mal detectados (por código): "
+                        + ", ".join(faltantes)
+                    )
+                return
 
         # 3) Mostrar tabla de control de los valores leídos
         filas_valores = []
@@ -574,30 +1033,19 @@ Se ignorará cualquier otra línea, como la cabecera o la fecha de actualizació
 
         st.success(f"Total de manzanas (TM) calculado correctamente: TM = {TM}")
 
-            # 5) Calcular Puntaje Accesibilidad y Puntaje Conexiones
-        puntaje_accesibilidad = (
-            puntajes["RDC"] * 0.5
-            + puntajes["RSR"] * 2.0
-            + puntajes["PP"] * 2.0
-            + puntajes["BQ"] * 1.0
-            + puntajes["GN"] * 0.5
-            + puntajes["SA"] * 1.0
-            + puntajes["PTP"] * 1.0
-            + puntajes["SRPP"] * 2.0
-        )
-
-        puntaje_conexiones = (
-            puntajes["RDC"] * 1.0
-            + puntajes["BQ"] * 1.0
-            + puntajes["GN"] * 1.0
-            + puntajes["CV"] * 1.5
-            + puntajes["CC"] * 0.5
-            + puntajes["LNC"] * 1.0
-            + puntajes["SP"] * 1.0
-            + puntajes["PTP"] * 1.0
-            + puntajes["EBC"] * 1.0
-            + puntajes["TC"] * 1.0
-        )
+        # 5) Calcular Puntaje Accesibilidad y Puntaje Conexiones
+        puntaje_accesibilidad, puntaje_conexiones = calcular_puntajes_agregados(puntajes)
+
+        # Se guarda también en pegados repetidos para registrar la etiqueta actual
+        if diario is not None:
+            diario.registrar(
+                huella,
+                "accesibilidad",
+                valores_indicadores,
+                area=area.strip(),
+                pa=puntaje_accesibilidad,
+                pc=puntaje_conexiones,
+            )
 
         # 6) Mostrar métricas para copiar y pegar
         st.subheader("Puntajes agregados")
@@ -675,10 +1123,320 @@ Se ignorará cualquier otra línea, como la cabecera o la fecha de actualizació
         )
 
 
+# --------------------------------------------------------------------
+# Sección 3: Tablero de resultados por lote
+# --------------------------------------------------------------------
+# Columnas agregadas que debe traer el CSV del lote. Los puntajes por
+# indicador son opcionales y se buscan por su nombre completo (no por código,
+# porque "PA" ya se usa para Puesto ambulante).
+COLUMNAS_LOTE = [
+    ("Proporción MNNAPAM", "MNNAPAM"),
+    ("Puntaje Accesibilidad (PA)", "PA"),
+    ("Puntaje Conexiones (PC)", "PC"),
+]
+
+# Límites para que el tablero siga fluido con 100k+ áreas: al navegador solo
+# llega una muestra acotada de puntos y los histogramas van ya agrupados.
+# La muestra es pequeña a propósito: la capa de densidad ya representa todo el
+# lote y estos puntos se reenvían en cada rerun de la página.
+MAX_PUNTOS_DISPERSION = 5_000
+BINS_HISTOGRAMA = 60
+BINS_DENSIDAD = 80
+
+
+@st.cache_data(show_spinner=False, max_entries=4)
+def cargar_lote(contenido: bytes) -> pd.DataFrame:
+    """
+    Lee el CSV de resultados por lote y devuelve un DataFrame con las columnas
+    "Área" (opcional), MNNAPAM, PA, PC y, si vienen, los puntajes por indicador
+    renombrados a su código (con prefijo "P_" para no chocar con PA/PC).
+    Lanza ValueError si faltan las columnas agregadas o si una misma variable
+    viene repetida (por ejemplo, "PA" y "Puntaje Accesibilidad (PA)").
+    """
+    df = pd.read_csv(io.BytesIO(contenido))
+    df.columns = [str(c).strip() for c in df.columns]
+
+    faltantes = [
+        etiqueta
+        for etiqueta, codigo in COLUMNAS_LOTE
+        if etiqueta not in df.columns and codigo not in df.columns
+    ]
+    if faltantes:
+        raise ValueError(
+            "El archivo no contiene las columnas requeridas: " + ", ".join(faltantes)
+        )
+
+    renombres = {etiqueta: codigo for etiqueta, codigo in COLUMNAS_LOTE}
+    renombres.update(
+        {nombre: f"P_{codigo}" for nombre, codigo in INDICADORES_ACCESO}
+    )
+    df = df.rename(columns=renombres)
+
+    repetidas = sorted(set(df.columns[df.columns.duplicated()]))
+    if repetidas:
+        raise ValueError(
+            "El archivo trae la misma variable en más de una columna: "
+            + ", ".join(repetidas)
+            + ". Deja solo una columna por variable."
+        )
+
+    columnas = [c for c in ["Área"] if c in df.columns]
+    numericas = [codigo for _, codigo in COLUMNAS_LOTE] + [
+        f"P_{codigo}" for _, codigo in INDICADORES_ACCESO if f"P_{codigo}" in df.columns
+    ]
+    df = df[columnas + numericas].copy()
+    # float32 basta para graficar y reduce a la mitad la memoria en lotes grandes
+    df[numericas] = df[numericas].apply(pd.to_numeric, errors="coerce").astype("float32")
+    # ±inf no se puede agrupar ni graficar; se trata igual que un valor faltante
+    df[numericas] = df[numericas].replace([np.inf, -np.inf], np.nan)
+    return df
+
+
+def _histograma_agrupado(valores: np.ndarray, bins: int):
+    """
+    Agrupa los valores en el servidor y devuelve (centros, conteos, ancho),
+    de modo que el navegador solo recibe `bins` barras en lugar de N puntos.
+    """
+    valores = valores[np.isfinite(valores)]
+    if valores.size == 0:
+        return np.array([]), np.array([]), 0.0
+    conteos, bordes = np.histogram(valores, bins=bins)
+    centros = (bordes[:-1] + bordes[1:]) / 2
+    return centros, conteos, float(bordes[1] - bordes[0])
+
+
+@st.cache_data(show_spinner=False, max_entries=4)
+def construir_figuras(contenido: bytes) -> dict:
+    """
+    Construye las especificaciones (dict) de las figuras del tablero.
+    Se cachean por contenido del archivo: en cada rerun solo se reenvía el
+    spec ya reducido, nunca los N puntos originales.
+    """
+    df = cargar_lote(contenido)
+    figuras = {}
+
+    # 1) Dispersión PA vs PC (WebGL). Con N grande se dibuja la densidad
+    #    agrupada en el servidor y encima una muestra fija de puntos.
+    pares = df[np.isfinite(df["PA"]) & np.isfinite(df["PC"])]
+    fig = go.Figure()
+    if len(pares) > MAX_PUNTOS_DISPERSION:
+        densidad, bordes_x, bordes_y = np.histogram2d(
+            pares["PA"].to_numpy(), pares["PC"].to_numpy(), bins=BINS_DENSIDAD
+        )
+        fig.add_trace(
+            go.Heatmap(
+                x=(bordes_x[:-1] + bordes_x[1:]) / 2,
+                y=(bordes_y[:-1] + bordes_y[1:]) / 2,
+                z=np.where(densidad.T > 0, densidad.T, np.nan),
+                colorscale="Blues",
+                colorbar={"title": "Áreas"},
+                hovertemplate="PA %{x:.2f}<br>PC %{y:.2f}<br>Áreas: %{z}<extra></extra>",
+            )
+        )
+        muestra = pares.sample(n=MAX_PUNTOS_DISPERSION, random_state=0)
+    else:
+        muestra = pares
+
+    fig.add_trace(
+        go.Scattergl(
+            x=muestra["PA"],
+            y=muestra["PC"],
+            mode="markers",
+            marker={"size": 4, "opacity": 0.5, "color": "#0047BB"},
+            text=muestra["Área"] if "Área" in muestra.columns else None,
+            hovertemplate="%{text}<br>PA %{x:.2f}<br>PC %{y:.2f}<extra></extra>"
+            if "Área" in muestra.columns
+            else "PA %{x:.2f}<br>PC %{y:.2f}<extra></extra>",
+            name="Áreas",
+        )
+    )
+    fig.update_layout(
+        xaxis_title="Puntaje Accesibilidad (PA)",
+        yaxis_title="Puntaje Conexiones (PC)",
+        showlegend=False,
+        margin={"t": 30},
+    )
+    figuras["dispersion"] = fig.to_dict()
+    figuras["n_total"] = len(pares)
+    figuras["n_muestra"] = len(muestra)
+    figuras["n_mnnapam"] = int(np.isfinite(df["MNNAPAM"]).sum())
+
+    # 2) Histograma de MNNAPAM (barras precalculadas)
+    centros, conteos, ancho = _histograma_agrupado(
+        df["MNNAPAM"].to_numpy(), BINS_HISTOGRAMA
+    )
+    fig = go.Figure(
+        go.Bar(
+            x=centros,
+            y=conteos,
+            width=ancho,
+            marker_color="#0047BB",
+            hovertemplate="MNNAPAM ≈ %{x:.2f}<br>Áreas: %{y}<extra></extra>",
+        )
+    )
+    fig.update_layout(
+        xaxis_title="Proporción MNNAPAM",
+        yaxis_title="Número de áreas",
+        bargap=0,
+        margin={"t": 30},
+    )
+    figuras["mnnapam"] = fig.to_dict()
+
+    # 3) Distribución de puntajes por indicador: cajas con cuartiles
+    #    calculados en el servidor (5 números por indicador).
+    codigos = [
+        codigo for _, codigo in INDICADORES_ACCESO if f"P_{codigo}" in df.columns
+    ]
+    if codigos:
+        cuantiles = (
+            df[[f"P_{codigo}" for codigo in codigos]]
+            .quantile([0.0, 0.25, 0.5, 0.75, 1.0])
+            .T
+        )
+        fig = go.Figure(
+            go.Box(
+                x=codigos,
+                lowerfence=cuantiles[0.0],
+                q1=cuantiles[0.25],
+                median=cuantiles[0.5],
+                q3=cuantiles[0.75],
+                upperfence=cuantiles[1.0],
+                marker_color="#0047BB",
+                name="Puntaje",
+            )
+        )
+        fig.update_layout(
+            xaxis_title="Indicador",
+            yaxis_title="Puntaje normalizado",
+            showlegend=False,
+            margin={"t": 30},
+        )
+        figuras["indicadores"] = fig.to_dict()
+
+    return figuras
+
+
+def lote_desde_historial(diario: DiarioConsultas) -> pd.DataFrame:
+    """
+    Arma el CSV del tablero a partir del historial: una fila por área
+    etiquetada, con MNNAPAM, PA, PC y el puntaje de cada indicador,
+    recalculados con las fórmulas actuales a partir de los conteos guardados.
+    Las áreas que solo tienen una de las dos consultas quedan con celdas vacías.
+    """
+    filas = {}
+    for area, seccion, conteos in diario.ultimos_por_area():
+        fila = filas.setdefault(area, {"Área": area})
+        try:
+            if seccion == "diversidad" and conteos_diversidad_completos(conteos):
+                fila["Proporción MNNAPAM"] = calcular_mnnapam(conteos)
+            elif seccion == "accesibilidad" and conteos_acceso_completos(conteos):
+                puntajes, _ = calcular_puntajes_acceso(conteos)
+                pa, pc = calcular_puntajes_agregados(puntajes)
+                fila["Puntaje Accesibilidad (PA)"] = pa
+                fila["Puntaje Conexiones (PC)"] = pc
+                for nombre, codigo in INDICADORES_ACCESO:
+                    fila[nombre] = puntajes[codigo]
+        except ValueError:
+            # Conteos guardados con PT o TM inválidos: se omiten esos valores
+            continue
+
+    columnas = (
+        ["Área"]
+        + [etiqueta for etiqueta, _ in COLUMNAS_LOTE]
+        + [nombre for nombre, _ in INDICADORES_ACCESO]
+    )
+    return pd.DataFrame(list(filas.values()), columns=columnas)
+
+
+def seccion_tablero_lote():
+    st.header("Tablero de resultados por lote")
+    st.markdown(
+        """
+Sube un archivo CSV con los resultados de varias áreas (una fila por área) para
+explorarlos en conjunto. Columnas esperadas:
+
+- **Proporción MNNAPAM** (o MNNAPAM)
+- **Puntaje Accesibilidad (PA)** (o PA)
+- **Puntaje Conexiones (PC)** (o PC)
+- **Área** (opcional): nombre o clave del área, se muestra al pasar el cursor.
+- Puntajes por indicador (opcionales), con el nombre exacto del indicador como
+  encabezado (por ejemplo, "Recubrimiento de la calle").
+
+Puedes generar este archivo desde el historial de consultas: incluye una fila
+por cada área a la que le pusiste **Etiqueta del área** en las otras secciones.
+"""
+    )
+
+    diario = obtener_diario()
+    if diario is not None:
+        if st.button("Generar CSV desde el historial de consultas"):
+            try:
+                lote = lote_desde_historial(diario)
+            except (sqlite3.Error, ValueError):
+                logger.exception("No se pudo exportar la bitácora de consultas")
+                st.warning("No se pudo leer el historial de consultas.")
+            else:
+                st.session_state["csv_historial"] = lote.to_csv(index=False).encode("utf-8")
+                st.session_state["n_historial"] = len(lote)
+
+        if "csv_historial" in st.session_state:
+            st.download_button(
+                f"Descargar CSV ({st.session_state['n_historial']:,} áreas)",
+                st.session_state["csv_historial"],
+                file_name="resultados_por_lote.csv",
+                mime="text/csv",
+            )
+
+    archivo = st.file_uploader("Archivo CSV con resultados por lote", type=["csv"])
+    if archivo is None:
+        return
+
+    contenido = archivo.getvalue()
+    try:
+        with st.spinner("Preparando el tablero..."):
+            figuras = construir_figuras(contenido)
+    except ValueError as e:
+        st.error(str(e))
+        return
+
+    st.subheader("PA vs PC")
+    if figuras["n_total"] == 0:
+        st.warning(
+            "No hay ninguna fila con PA y PC numéricos válidos. Revisa que los "
+            "decimales usen punto (por ejemplo, 3.25) y no coma."
+        )
+    elif figuras["n_muestra"] < figuras["n_total"]:
+        st.caption(
+            f"Se muestran {figuras['n_muestra']:,} de {figuras['n_total']:,} áreas "
+            "sobre la densidad de todo el lote."
+        )
+    st.plotly_chart(figuras["dispersion"], width="stretch")
+
+    st.subheader("Distribución de MNNAPAM")
+    if figuras["n_mnnapam"] == 0:
+        st.warning(
+            "No hay ningún valor de MNNAPAM numérico válido. Revisa que los "
+            "decimales usen punto (por ejemplo, 3.25) y no coma."
+        )
+    st.plotly_chart(figuras["mnnapam"], width="stretch")
+
+    if "indicadores" in figuras:
+        st.subheader("Distribución de puntajes por indicador")
+        st.plotly_chart(figuras["indicadores"], width="stretch")
+
+
 # --------------------------------------------------------------------
 # Mostrar la sección según la opción elegida
 # --------------------------------------------------------------------
+# El historial se muestra después del cálculo para incluir el resultado recién obtenido
 if opcion == "Porcentaje de diversidad":
     seccion_diversidad()
-else:
+    mostrar_historial("diversidad", {"mnnapam": "Proporción MNNAPAM"})
+elif opcion == "Puntos de accesibilidad y conexión":
     seccion_accesibilidad_conexion()
+    mostrar_historial(
+        "accesibilidad",
+        {"pa": "Puntaje Accesibilidad (PA)", "pc": "Puntaje Conexiones (PC)"},
+    )
+else:
+    seccion_tablero_lote()